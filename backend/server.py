@@ -1,14 +1,34 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Query, Request, status
+from fastapi.encoders import jsonable_encoder
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.middleware.cors import CORSMiddleware
+from starlette.datastructures import MutableHeaders
+from starlette.responses import FileResponse, JSONResponse, Response
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import DuplicateKeyError
 import os
+import re
+import json
+import base64
+import time
+import random
+import asyncio
+import cProfile
+import pstats
 import logging
+from collections import OrderedDict
+from contextvars import ContextVar
 from pathlib import Path
+from urllib.parse import unquote
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 import uuid
+import gzip
+import brotli
+import hashlib
 from datetime import datetime, timezone, timedelta
 import jwt
 from passlib.context import CryptContext
@@ -26,6 +46,39 @@ SECRET_KEY = os.environ.get('SECRET_KEY', 'your-secret-key-change-in-production'
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
+# Task query Config
+TASK_SORT_FIELDS = ("updated_at", "created_at", "title")
+TASK_PAGE_MAX_LIMIT = 200
+
+# Batch Config
+BATCH_MAX_REQUESTS = 25
+BATCH_METHODS = {"GET", "POST", "PUT", "DELETE"}
+
+# Profiling Config
+PROFILE_DIR = Path(os.environ.get('PROFILE_DIR', ROOT_DIR / 'profiles'))
+PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', 50))
+PROFILE_ADMIN_IDS = {i.strip() for i in os.environ.get('PROFILE_ADMIN_IDS', '').split(',') if i.strip()}
+PROFILE_SAMPLE_RATE = int(os.environ.get('PROFILE_SAMPLE_RATE', 0))  # 1-in-N requests, 0 disables
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', 500))
+PROFILE_CATEGORIES = {
+    "pydantic": ("pydantic",),
+    "jwt": ("jwt",),
+    "bcrypt": ("bcrypt", "passlib"),
+    "motor": ("motor", "pymongo", "bson"),
+}
+
+# Compression Config
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))  # bytes
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+METRICS_ADMIN_IDS = {i.strip() for i in os.environ.get('METRICS_ADMIN_IDS', '').split(',') if i.strip()}
+
+# Idempotency Config
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', 60 * 60 * 24))  # 24 hours
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', 1024))
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get('IDEMPOTENCY_WAIT_SECONDS', 10))
+IDEMPOTENCY_LEASE_SECONDS = float(os.environ.get('IDEMPOTENCY_LEASE_SECONDS', 30))  # pending records older than this are taken over
+IDEMPOTENCY_POLL_SECONDS = 0.1
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
@@ -108,6 +161,10 @@ class TaskUpdate(BaseModel):
     description: Optional[str] = None
     status: Optional[str] = None
 
+class TaskPage(BaseModel):
+    items: List[Task]
+    next_cursor: Optional[str] = None
+
 class Comment(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -121,6 +178,36 @@ class CommentCreate(BaseModel):
     task_id: str
     text: str
 
+class BatchSubRequest(BaseModel):
+    method: str
+    path: str
+    body: Optional[Any] = None
+    headers: Optional[Dict[str, str]] = None
+
+class BatchResult(BaseModel):
+    status: int
+    body: Optional[Any] = None
+
+class ProfileInfo(BaseModel):
+    id: str
+    method: str
+    path: str
+    status_code: int
+    trigger: str
+    wall_ms: float
+    cpu_ms: float
+    await_ms: float
+    breakdown: Dict[str, float]
+    created_at: str
+
+class CompressionStat(BaseModel):
+    route: str
+    responses: int
+    compressed_responses: int
+    original_bytes: int
+    sent_bytes: int
+    saved_bytes: int
+
 # ============= Auth Utilities =============
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -135,7 +222,14 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+# Set by POST /api/batch so sub-requests reuse the already authenticated user
+_batch_user: ContextVar[Optional[User]] = ContextVar("batch_user", default=None)
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    batch_user = _batch_user.get()
+    if batch_user is not None:
+        return batch_user
+    
     token = credentials.credentials
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -152,6 +246,139 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         raise HTTPException(status_code=401, detail="User not found")
     return User(**user)
 
+# ============= Idempotency =============
+# Stored responses keyed by (user_id, route, key). A pending record is
+# reserved in the idempotency_keys collection before the handler runs, so
+# only one worker executes a given key; its lease lets a retry take over
+# if that worker dies mid-request. The LRU sits in front of the
+# collection, and in-flight requests for the same key are coalesced so a
+# retry arriving mid-request waits for the original.
+_idempotency_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+_idempotency_inflight: dict = {}
+
+def _idempotency_cache_get(cache_key):
+    entry = _idempotency_cache.get(cache_key)
+    if entry is None:
+        return None
+    # Expire alongside the TTL index so memory never outlives Mongo
+    if time.monotonic() - entry[0] > IDEMPOTENCY_TTL_SECONDS:
+        del _idempotency_cache[cache_key]
+        return None
+    _idempotency_cache.move_to_end(cache_key)
+    return entry
+
+def _idempotency_cache_put(cache_key, request_hash, response):
+    _idempotency_cache[cache_key] = (time.monotonic(), request_hash, response)
+    _idempotency_cache.move_to_end(cache_key)
+    while len(_idempotency_cache) > IDEMPOTENCY_CACHE_SIZE:
+        _idempotency_cache.popitem(last=False)
+
+def _check_request_hash(stored_hash: str, request_hash: str):
+    if stored_hash != request_hash:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+
+async def _claim_or_wait(query: dict, request_hash: str):
+    """Reserve the key for this request, or wait for the owner's response.
+    
+    Returns (True, None) once this request owns the key, otherwise
+    (False, response) with the stored response to replay.
+    """
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        now = datetime.now(timezone.utc)
+        try:
+            await db.idempotency_keys.insert_one({
+                **query,
+                "request_hash": request_hash,
+                "state": "pending",
+                "locked_at": now,
+                "created_at": now
+            })
+            return True, None
+        except DuplicateKeyError:
+            pass
+        
+        # Another request (possibly on another worker) owns this key
+        stored = await db.idempotency_keys.find_one(query, {"_id": 0})
+        if stored is None:
+            # The owner failed and released its reservation; try again
+            continue
+        _check_request_hash(stored["request_hash"], request_hash)
+        if stored["state"] == "completed":
+            return False, stored["response"]
+        
+        # A pending record whose lease expired belongs to a dead worker
+        lease_cutoff = now - timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)
+        taken = await db.idempotency_keys.find_one_and_update(
+            {**query, "state": "pending", "locked_at": {"$lt": lease_cutoff}},
+            {"$set": {"locked_at": now}}
+        )
+        if taken is not None:
+            return True, None
+        
+        if time.monotonic() >= deadline:
+            raise HTTPException(status_code=409, detail="Request with this Idempotency-Key is still in progress")
+        await asyncio.sleep(IDEMPOTENCY_POLL_SECONDS)
+
+async def _execute_idempotent(query: dict, request_hash: str, handler):
+    owned, response = await _claim_or_wait(query, request_hash)
+    if not owned:
+        return response
+    
+    try:
+        response = jsonable_encoder(await handler())
+    except Exception:
+        # Release the reservation so the client can retry
+        await db.idempotency_keys.delete_one({**query, "state": "pending"})
+        raise
+    
+    await db.idempotency_keys.update_one(query, {"$set": {"state": "completed", "response": response}})
+    return response
+
+async def run_idempotent(user_id: str, route: str, key: Optional[str], payload: BaseModel, handler):
+    """Run handler once per (user_id, route, key) and replay its response for retries"""
+    if not key:
+        return await handler()
+    
+    request_hash = hashlib.sha256(payload.model_dump_json().encode()).hexdigest()
+    cache_key = (user_id, route, key)
+    cached = _idempotency_cache_get(cache_key)
+    if cached is not None:
+        _check_request_hash(cached[1], request_hash)
+        return cached[2]
+    
+    inflight = _idempotency_inflight.get(cache_key)
+    if inflight is None:
+        query = {"user_id": user_id, "route": route, "key": key}
+        task = asyncio.ensure_future(_execute_idempotent(query, request_hash, handler))
+        _idempotency_inflight[cache_key] = (task, request_hash)
+        
+        def _finish(done):
+            _idempotency_inflight.pop(cache_key, None)
+            if not done.cancelled() and done.exception() is None:
+                _idempotency_cache_put(cache_key, request_hash, done.result())
+        task.add_done_callback(_finish)
+    else:
+        task, inflight_hash = inflight
+        _check_request_hash(inflight_hash, request_hash)
+    
+    # Shield so a disconnecting retry does not cancel the shared work
+    return await asyncio.shield(task)
+
+# ============= Field Projection =============
+def parse_fields(fields: Optional[str], model, *extra: str) -> Optional[dict]:
+    """Turn a comma separated fields= parameter into a Motor projection"""
+    if not fields:
+        return None
+    requested = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = requested - set(model.model_fields)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    
+    projection = {"_id": 0, "id": 1}
+    projection.update({f: 1 for f in requested | set(extra)})
+    return projection
+
 # ============= Auth Routes =============
 @api_router.post("/auth/register", response_model=Token)
 async def register(user_input: UserCreate):
@@ -190,32 +417,43 @@ async def get_me(current_user: User = Depends(get_current_user)):
 
 # ============= Client Routes =============
 @api_router.get("/clients", response_model=List[Client])
-async def get_clients(current_user: User = Depends(get_current_user)):
-    clients = await db.clients.find({}, {"_id": 0}).to_list(1000)
+async def get_clients(fields: Optional[str] = None, current_user: User = Depends(get_current_user)):
+    projection = parse_fields(fields, Client)
+    clients = await db.clients.find({}, projection or {"_id": 0}).to_list(1000)
+    if projection:
+        # Partial documents skip response_model validation
+        return JSONResponse(clients)
     return clients
 
 @api_router.post("/clients", response_model=Client)
-async def create_client(client_input: ClientCreate, current_user: User = Depends(get_current_user)):
-    client = Client(
-        name=client_input.name,
-        description=client_input.description,
-        created_by=current_user.id
-    )
-    client_doc = client.model_dump()
-    await db.clients.insert_one(client_doc)
-    
-    # Create predefined tasks for this client
-    for idx, task_title in enumerate(PREDEFINED_TASKS):
-        task = Task(
-            client_id=client.id,
-            title=task_title,
-            description="",
-            status="pending",
-            order=idx
+async def create_client(
+    client_input: ClientCreate,
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    async def handler():
+        client = Client(
+            name=client_input.name,
+            description=client_input.description,
+            created_by=current_user.id
         )
-        await db.tasks.insert_one(task.model_dump())
+        client_doc = client.model_dump()
+        await db.clients.insert_one(client_doc)
+        
+        # Create predefined tasks for this client
+        for idx, task_title in enumerate(PREDEFINED_TASKS):
+            task = Task(
+                client_id=client.id,
+                title=task_title,
+                description="",
+                status="pending",
+                order=idx
+            )
+            await db.tasks.insert_one(task.model_dump())
+        
+        return client
     
-    return client
+    return await run_idempotent(current_user.id, "POST /api/clients", idempotency_key, client_input, handler)
 
 @api_router.put("/clients/{client_id}", response_model=Client)
 async def update_client(client_id: str, client_input: ClientUpdate, current_user: User = Depends(get_current_user)):
@@ -251,25 +489,116 @@ async def delete_client(client_id: str, current_user: User = Depends(get_current
 
 # ============= Task Routes =============
 @api_router.get("/tasks/{client_id}", response_model=List[Task])
-async def get_tasks(client_id: str, current_user: User = Depends(get_current_user)):
-    tasks = await db.tasks.find({"client_id": client_id}, {"_id": 0}).sort("order", 1).to_list(1000)
+async def get_tasks(client_id: str, fields: Optional[str] = None, current_user: User = Depends(get_current_user)):
+    projection = parse_fields(fields, Task)
+    tasks = await db.tasks.find({"client_id": client_id}, projection or {"_id": 0}).sort("order", 1).to_list(1000)
+    if projection:
+        return JSONResponse(tasks)
     return tasks
 
+def encode_task_cursor(value, task_id: str) -> str:
+    raw = json.dumps([value, task_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_task_cursor(cursor: str):
+    try:
+        value, task_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # Only plain scalars may reach the query; dicts would act as operators
+    if isinstance(value, bool) or not isinstance(value, (str, int)) or not isinstance(task_id, str):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return value, task_id
+
+def to_iso_utc(value: datetime) -> str:
+    # updated_at is stored as a UTC ISO string, so ranges compare lexically
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat()
+
+@api_router.get("/tasks", response_model=TaskPage)
+async def query_tasks(
+    status: Optional[str] = None,
+    client_id: Optional[List[str]] = Query(None),
+    updated_after: Optional[datetime] = None,
+    updated_before: Optional[datetime] = None,
+    title_prefix: Optional[str] = None,
+    sort: str = "updated_at",
+    direction: str = "asc",
+    limit: int = Query(50, ge=1, le=TASK_PAGE_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    if sort not in TASK_SORT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"Cannot sort by '{sort}'")
+    if direction not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="Direction must be 'asc' or 'desc'")
+    # The sort field is always projected so the next cursor can be built
+    projection = parse_fields(fields, Task, sort)
+    
+    # Equality filters first, then ranges, so the compound indexes apply
+    query = {}
+    if status:
+        query["status"] = status
+    if client_id:
+        query["client_id"] = client_id[0] if len(client_id) == 1 else {"$in": client_id}
+    if title_prefix:
+        query["title"] = {"$regex": "^" + re.escape(title_prefix)}
+    
+    updated_range = {}
+    if updated_after:
+        updated_range["$gte"] = to_iso_utc(updated_after)
+    if updated_before:
+        updated_range["$lt"] = to_iso_utc(updated_before)
+    if updated_range:
+        query["updated_at"] = updated_range
+    
+    sort_order = 1 if direction == "asc" else -1
+    if cursor:
+        # Keyset pagination: resume strictly after the last (sort value, id) seen
+        last_value, last_id = decode_task_cursor(cursor)
+        op = "$gt" if sort_order == 1 else "$lt"
+        query = {"$and": [query, {"$or": [
+            {sort: {op: last_value}},
+            {sort: last_value, "id": {op: last_id}}
+        ]}]}
+    
+    tasks = await db.tasks.find(query, projection or {"_id": 0}).sort(
+        [(sort, sort_order), ("id", sort_order)]
+    ).limit(limit + 1).to_list(limit + 1)
+    
+    next_cursor = None
+    if len(tasks) > limit:
+        tasks = tasks[:limit]
+        next_cursor = encode_task_cursor(tasks[-1][sort], tasks[-1]["id"])
+    
+    if projection:
+        return JSONResponse({"items": tasks, "next_cursor": next_cursor})
+    return TaskPage(items=tasks, next_cursor=next_cursor)
+
 @api_router.post("/tasks", response_model=Task)
-async def create_task(task_input: TaskCreate, current_user: User = Depends(get_current_user)):
-    # Get max order for this client
-    tasks = await db.tasks.find({"client_id": task_input.client_id}, {"_id": 0, "order": 1}).to_list(1000)
-    max_order = max([t["order"] for t in tasks], default=-1)
-    
-    task = Task(
-        client_id=task_input.client_id,
-        title=task_input.title,
-        description=task_input.description,
-        status=task_input.status,
-        order=max_order + 1
-    )
-    await db.tasks.insert_one(task.model_dump())
-    return task
+async def create_task(
+    task_input: TaskCreate,
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    async def handler():
+        # Get max order for this client
+        tasks = await db.tasks.find({"client_id": task_input.client_id}, {"_id": 0, "order": 1}).to_list(1000)
+        max_order = max([t["order"] for t in tasks], default=-1)
+        
+        task = Task(
+            client_id=task_input.client_id,
+            title=task_input.title,
+            description=task_input.description,
+            status=task_input.status,
+            order=max_order + 1
+        )
+        await db.tasks.insert_one(task.model_dump())
+        return task
+    
+    return await run_idempotent(current_user.id, "POST /api/tasks", idempotency_key, task_input, handler)
 
 @api_router.put("/tasks/{task_id}", response_model=Task)
 async def update_task(task_id: str, task_input: TaskUpdate, current_user: User = Depends(get_current_user)):
@@ -299,20 +628,30 @@ async def delete_task(task_id: str, current_user: User = Depends(get_current_use
 
 # ============= Comment Routes =============
 @api_router.get("/comments/{task_id}", response_model=List[Comment])
-async def get_comments(task_id: str, current_user: User = Depends(get_current_user)):
-    comments = await db.comments.find({"task_id": task_id}, {"_id": 0}).sort("created_at", 1).to_list(1000)
+async def get_comments(task_id: str, fields: Optional[str] = None, current_user: User = Depends(get_current_user)):
+    projection = parse_fields(fields, Comment)
+    comments = await db.comments.find({"task_id": task_id}, projection or {"_id": 0}).sort("created_at", 1).to_list(1000)
+    if projection:
+        return JSONResponse(comments)
     return comments
 
 @api_router.post("/comments", response_model=Comment)
-async def create_comment(comment_input: CommentCreate, current_user: User = Depends(get_current_user)):
-    comment = Comment(
-        task_id=comment_input.task_id,
-        user_id=current_user.id,
-        username=current_user.username,
-        text=comment_input.text
-    )
-    await db.comments.insert_one(comment.model_dump())
-    return comment
+async def create_comment(
+    comment_input: CommentCreate,
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    async def handler():
+        comment = Comment(
+            task_id=comment_input.task_id,
+            user_id=current_user.id,
+            username=current_user.username,
+            text=comment_input.text
+        )
+        await db.comments.insert_one(comment.model_dump())
+        return comment
+    
+    return await run_idempotent(current_user.id, "POST /api/comments", idempotency_key, comment_input, handler)
 
 @api_router.delete("/comments/{comment_id}")
 async def delete_comment(comment_id: str, current_user: User = Depends(get_current_user)):
@@ -327,9 +666,290 @@ async def delete_comment(comment_id: str, current_user: User = Depends(get_curre
     await db.comments.delete_one({"id": comment_id})
     return {"message": "Comment deleted successfully"}
 
+# ============= Batch Routes =============
+async def dispatch_sub_request(request: Request, sub_request: BatchSubRequest, path: str) -> BatchResult:
+    raw_path, _, query_string = sub_request.path.partition("?")
+    body = b"" if sub_request.body is None else json.dumps(sub_request.body).encode()
+    
+    headers = {name.lower(): value for name, value in (sub_request.headers or {}).items()}
+    headers["authorization"] = request.headers.get("authorization", "")
+    headers["content-type"] = "application/json"
+    headers["content-length"] = str(len(body))
+    
+    # Reuse the outer scope so app state and exception handlers carry over
+    scope = dict(
+        request.scope,
+        method=sub_request.method.upper(),
+        path=path,
+        raw_path=raw_path.encode(),
+        query_string=query_string.encode(),
+        headers=[(name.encode(), value.encode()) for name, value in headers.items()],
+        path_params={}
+    )
+    
+    body_sent = False
+    async def receive():
+        nonlocal body_sent
+        if body_sent:
+            return {"type": "http.disconnect"}
+        body_sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+    
+    response_status = 500
+    chunks = []
+    async def send(message):
+        nonlocal response_status
+        if message["type"] == "http.response.start":
+            response_status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+    
+    try:
+        await api_router(scope, receive, send)
+    except StarletteHTTPException as exc:
+        # Unmatched paths and methods are raised by the router itself
+        return BatchResult(status=exc.status_code, body={"detail": exc.detail})
+    except Exception:
+        # Fail only this item, as a direct request would get a 500
+        logger.exception("Batch sub-request %s %s failed", sub_request.method, sub_request.path)
+        return BatchResult(status=500, body={"detail": "Internal Server Error"})
+    
+    raw = b"".join(chunks)
+    try:
+        response_body = json.loads(raw) if raw else None
+    except ValueError:
+        response_body = raw.decode(errors="replace")
+    return BatchResult(status=response_status, body=response_body)
+
+@api_router.post("/batch", response_model=List[BatchResult])
+async def batch(
+    sub_requests: List[BatchSubRequest],
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    if len(sub_requests) > BATCH_MAX_REQUESTS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_REQUESTS} requests per batch")
+    # Decode once so validation sees the same path the router will match
+    paths = []
+    for sub_request in sub_requests:
+        if sub_request.method.upper() not in BATCH_METHODS:
+            raise HTTPException(status_code=400, detail=f"Unsupported method '{sub_request.method}'")
+        path = unquote(sub_request.path.partition("?")[0])
+        if not path.startswith("/api/") or path.rstrip("/") == "/api/batch":
+            raise HTTPException(status_code=400, detail=f"Invalid batch path '{sub_request.path}'")
+        paths.append(path)
+    
+    results: List[BatchResult] = []
+    token = _batch_user.set(current_user)
+    try:
+        # Consecutive reads run concurrently; writes run in order between them
+        reads = []
+        for sub_request, path in zip(sub_requests, paths):
+            if sub_request.method.upper() == "GET":
+                reads.append((sub_request, path))
+                continue
+            if reads:
+                results.extend(await asyncio.gather(*[dispatch_sub_request(request, r, p) for r, p in reads]))
+                reads = []
+            results.append(await dispatch_sub_request(request, sub_request, path))
+        if reads:
+            results.extend(await asyncio.gather(*[dispatch_sub_request(request, r, p) for r, p in reads]))
+    finally:
+        _batch_user.reset(token)
+    
+    return results
+
+# ============= Profiling =============
+# cProfile can only run one profiler per thread, so at most one request is
+# profiled at a time. Other requests interleaving on the event loop during
+# that window show up in the profile as well.
+_profiling_active = False
+
+def _token_user_id(request: Request) -> Optional[str]:
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+    except jwt.InvalidTokenError:
+        return None
+
+def _profile_breakdown(profiler: cProfile.Profile) -> Dict[str, float]:
+    # Sum own time per library so nested calls are not double counted
+    breakdown = {category: 0.0 for category in PROFILE_CATEGORIES}
+    for (filename, _, funcname), (_, _, own_time, _, _) in pstats.Stats(profiler).stats.items():
+        location = f"{filename}:{funcname}".lower()
+        for category, markers in PROFILE_CATEGORIES.items():
+            if any(marker in location for marker in markers):
+                breakdown[category] += own_time * 1000
+                break
+    return {category: round(ms, 3) for category, ms in breakdown.items()}
+
+def _save_profile(profiler: cProfile.Profile, info: ProfileInfo):
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    profiler.dump_stats(PROFILE_DIR / f"{info.id}.prof")
+    (PROFILE_DIR / f"{info.id}.json").write_text(info.model_dump_json())
+    
+    # Keep the directory bounded by dropping the oldest profiles
+    profiles = sorted(PROFILE_DIR.glob("*.prof"), key=lambda p: p.stat().st_mtime)
+    for stale in profiles[:max(len(profiles) - PROFILE_MAX_FILES, 0)]:
+        stale.unlink(missing_ok=True)
+        stale.with_suffix(".json").unlink(missing_ok=True)
+
+async def profile_requests(request: Request, call_next):
+    global _profiling_active
+    
+    trigger = None
+    if request.headers.get("x-profile") == "1" or request.query_params.get("profile") == "1":
+        if _token_user_id(request) in PROFILE_ADMIN_IDS:
+            trigger = "explicit"
+    elif PROFILE_SAMPLE_RATE and random.randrange(PROFILE_SAMPLE_RATE) == 0:
+        trigger = "sampled"
+    
+    if trigger is None or _profiling_active:
+        return await call_next(request)
+    
+    _profiling_active = True
+    profiler = cProfile.Profile()
+    wall_start, cpu_start = time.perf_counter(), time.thread_time()
+    profiler.enable()
+    try:
+        response = await call_next(request)
+    finally:
+        profiler.disable()
+        _profiling_active = False
+    wall_ms = (time.perf_counter() - wall_start) * 1000
+    cpu_ms = (time.thread_time() - cpu_start) * 1000
+    
+    # Sampled profiles are only worth keeping for slow requests
+    if trigger == "sampled" and wall_ms < PROFILE_SLOW_MS:
+        return response
+    
+    info = ProfileInfo(
+        id=f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}",
+        method=request.method,
+        path=request.url.path,
+        status_code=response.status_code,
+        trigger=trigger,
+        wall_ms=round(wall_ms, 3),
+        cpu_ms=round(cpu_ms, 3),
+        # Time the event loop thread spent waiting, mostly Motor I/O
+        await_ms=round(max(wall_ms - cpu_ms, 0.0), 3),
+        breakdown=_profile_breakdown(profiler),
+        created_at=datetime.now(timezone.utc).isoformat()
+    )
+    await asyncio.to_thread(_save_profile, profiler, info)
+    response.headers["X-Profile-Id"] = info.id
+    return response
+
+async def get_profiling_admin(current_user: User = Depends(get_current_user)):
+    if current_user.id not in PROFILE_ADMIN_IDS:
+        raise HTTPException(status_code=403, detail="Not authorized to access profiles")
+    return current_user
+
+def _load_profiles() -> List[ProfileInfo]:
+    if not PROFILE_DIR.exists():
+        return []
+    profiles = [ProfileInfo.model_validate_json(p.read_text()) for p in PROFILE_DIR.glob("*.json")]
+    return sorted(profiles, key=lambda p: p.created_at, reverse=True)
+
+@api_router.get("/admin/profiles", response_model=List[ProfileInfo])
+async def list_profiles(current_user: User = Depends(get_profiling_admin)):
+    return await asyncio.to_thread(_load_profiles)
+
+@api_router.get("/admin/profiles/{profile_id}")
+async def download_profile(profile_id: str, current_user: User = Depends(get_profiling_admin)):
+    path = PROFILE_DIR / f"{profile_id}.prof"
+    if not re.fullmatch(r"[\w-]+", profile_id) or not path.exists():
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=path.name)
+
+# ============= Compression =============
+# Per-route byte counters, keyed by "METHOD /route/{template}"
+_compression_stats: Dict[str, Dict[str, int]] = {}
+
+def _choose_encoding(accept_encoding: str) -> Optional[str]:
+    weights = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name.strip():
+            weights[name.strip()] = q
+    
+    # Highest q wins, q=0 means "not acceptable"; brotli wins ties
+    wildcard = weights.get("*", 0.0)
+    best, best_q = None, 0.0
+    for encoding in ("br", "gzip"):
+        q = weights.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+def _record_compression(route: str, original: int, sent: int):
+    stat = _compression_stats.setdefault(
+        route, {"responses": 0, "compressed_responses": 0, "original_bytes": 0, "sent_bytes": 0}
+    )
+    stat["responses"] += 1
+    stat["compressed_responses"] += int(sent < original)
+    stat["original_bytes"] += original
+    stat["sent_bytes"] += sent
+
+async def compress_responses(request: Request, call_next):
+    response = await call_next(request)
+    encoding = _choose_encoding(request.headers.get("accept-encoding", ""))
+    content_type = response.headers.get("content-type", "")
+    if encoding is None or "content-encoding" in response.headers or not content_type.startswith(COMPRESSIBLE_TYPES):
+        return response
+    
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    headers = MutableHeaders(raw=list(response.headers.raw))
+    route = request.scope.get("route")
+    # Unmatched paths share one bucket so clients cannot grow the stats
+    route_key = f"{request.method} {route.path}" if route else "unmatched"
+    
+    if len(body) < COMPRESSION_MIN_SIZE:
+        _record_compression(route_key, len(body), len(body))
+        return Response(content=body, status_code=response.status_code, headers=headers)
+    
+    if encoding == "br":
+        compressed = brotli.compress(body, quality=5)
+    else:
+        compressed = gzip.compress(body, compresslevel=6)
+    _record_compression(route_key, len(body), len(compressed))
+    
+    del headers["content-length"]
+    headers["content-encoding"] = encoding
+    headers.add_vary_header("Accept-Encoding")
+    return Response(content=compressed, status_code=response.status_code, headers=headers)
+
+async def get_metrics_admin(current_user: User = Depends(get_current_user)):
+    if current_user.id not in METRICS_ADMIN_IDS:
+        raise HTTPException(status_code=403, detail="Not authorized to access metrics")
+    return current_user
+
+@api_router.get("/admin/compression-stats", response_model=List[CompressionStat])
+async def get_compression_stats(current_user: User = Depends(get_metrics_admin)):
+    stats = [
+        CompressionStat(route=route, saved_bytes=stat["original_bytes"] - stat["sent_bytes"], **stat)
+        for route, stat in _compression_stats.items()
+    ]
+    return sorted(stats, key=lambda s: s.saved_bytes, reverse=True)
+
 # ============= App Setup =============
 app.include_router(api_router)
 
+app.add_middleware(BaseHTTPMiddleware, dispatch=compress_responses)
+
+if PROFILE_ADMIN_IDS or PROFILE_SAMPLE_RATE:
+    app.add_middleware(BaseHTTPMiddleware, dispatch=profile_requests)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -344,6 +964,21 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_indexes():
+    await db.idempotency_keys.create_index([("user_id", 1), ("route", 1), ("key", 1)], unique=True)
+    await db.idempotency_keys.create_index("created_at", expireAfterSeconds=IDEMPOTENCY_TTL_SECONDS)
+    
+    await db.tasks.create_index([("client_id", 1), ("order", 1)])
+    
+    # Compound indexes for GET /api/tasks (equality, sort, range) for every
+    # sort field. status plus client_id uses the client_id index and filters
+    # status from that client's handful of tasks.
+    for field in TASK_SORT_FIELDS:
+        await db.tasks.create_index([(field, 1), ("id", 1)])
+        await db.tasks.create_index([("status", 1), (field, 1), ("id", 1)])
+        await db.tasks.create_index([("client_id", 1), (field, 1), ("id", 1)])
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
\ No newline at end of file
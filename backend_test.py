@@ -165,6 +165,48 @@ class TaskManagerAPITester:
             return True
         return False
 
+    def test_idempotent_client_creation(self):
+        """Test that retrying a client creation with the same Idempotency-Key replays it"""
+        client_data = {
+            "name": "Idempotent Client",
+            "description": "Created twice with one Idempotency-Key"
+        }
+        headers = {'Idempotency-Key': f"test-{datetime.now().strftime('%H%M%S%f')}"}
+        
+        success, first = self.run_test(
+            "Create Client (Idempotency-Key)",
+            "POST",
+            "clients",
+            200,
+            data=client_data,
+            headers=headers
+        )
+        if not success:
+            return False
+        
+        success, retry = self.run_test(
+            "Retry Client Creation (Idempotency-Key)",
+            "POST",
+            "clients",
+            200,
+            data=client_data,
+            headers=headers
+        )
+        if not success:
+            return False
+        
+        if retry.get('id') != first.get('id'):
+            self.log_test("Idempotent Replay", False, f"Expected {first.get('id')}, got {retry.get('id')}")
+            return False
+        
+        self.run_test(
+            "Delete Idempotent Client",
+            "DELETE",
+            f"clients/{first['id']}",
+            200
+        )
+        return True
+
     def test_get_tasks_for_client(self):
         """Test getting tasks for a client (should have 11 predefined tasks)"""
         if not hasattr(self, 'client_id'):
@@ -186,6 +228,124 @@ class TaskManagerAPITester:
                 self.log_test("Predefined Tasks Count", False, f"Expected 11 tasks, got {len(response)}")
         return False
 
+    def test_query_pending_tasks(self):
+        """Test the cross-client pending task query with keyset pagination"""
+        if not hasattr(self, 'client_id'):
+            return False
+        
+        endpoint = f"tasks?status=pending&client_id={self.client_id}&sort=title&limit=5"
+        tasks = []
+        cursor = None
+        for page in range(1, 5):
+            page_endpoint = f"{endpoint}&cursor={cursor}" if cursor else endpoint
+            success, response = self.run_test(
+                f"Query Pending Tasks (page {page})",
+                "GET",
+                page_endpoint,
+                200
+            )
+            if not success:
+                return False
+            tasks.extend(response.get('items', []))
+            cursor = response.get('next_cursor')
+            if not cursor:
+                break
+        
+        titles = [t['title'] for t in tasks]
+        ids = [t['id'] for t in tasks]
+        ok = len(tasks) == 11 and titles == sorted(titles) and len(set(ids)) == len(ids)
+        self.log_test("Keyset Pagination", ok, f"Got {len(tasks)} tasks over {page} pages, titles {titles}")
+        return ok
+
+    def test_get_tasks_with_fields(self):
+        """Test sparse field projection on the client task list"""
+        if not hasattr(self, 'client_id'):
+            return False
+        
+        success, response = self.run_test(
+            "Get Client Tasks (fields=title,status)",
+            "GET",
+            f"tasks/{self.client_id}?fields=title,status",
+            200
+        )
+        if not success or not isinstance(response, list) or not response:
+            return False
+        
+        keys = set(response[0].keys())
+        ok = keys == {"id", "title", "status"}
+        self.log_test("Sparse Field Projection", ok, f"Expected ['id', 'status', 'title'], got {sorted(keys)}")
+        return ok
+
+    def test_get_tasks_compressed(self):
+        """Test that large task lists are gzipped when the client accepts it"""
+        if not hasattr(self, 'client_id'):
+            return False
+        
+        url = f"{self.api_url}/tasks/{self.client_id}"
+        headers = {'Authorization': f'Bearer {self.token}', 'Accept-Encoding': 'gzip'}
+        print(f"\n🔍 Testing Get Client Tasks (gzip)...")
+        print(f"   URL: {url}")
+        
+        try:
+            response = requests.get(url, headers=headers, timeout=10)
+            encoding = response.headers.get('Content-Encoding')
+            success = response.status_code == 200 and encoding == 'gzip'
+            self.log_test("Get Client Tasks (gzip)", success, f"Status {response.status_code}, Content-Encoding {encoding}")
+            return success
+        except Exception as e:
+            self.log_test("Get Client Tasks (gzip)", False, f"Exception: {str(e)}")
+            return False
+
+    def test_batch_requests(self):
+        """Test multiplexing several reads through the batch endpoint"""
+        if not hasattr(self, 'client_id'):
+            return False
+        
+        sub_requests = [
+            {"method": "GET", "path": "/api/auth/me"},
+            {"method": "GET", "path": f"/api/tasks/{self.client_id}"},
+            {"method": "GET", "path": "/api/does-not-exist"}
+        ]
+        success, response = self.run_test(
+            "Batch Requests",
+            "POST",
+            "batch",
+            200,
+            data=sub_requests
+        )
+        if not success or not isinstance(response, list):
+            return False
+        
+        statuses = [item['status'] for item in response]
+        ok = statuses == [200, 200, 404]
+        self.log_test("Batch Sub-request Statuses", ok, f"Expected [200, 200, 404], got {statuses}")
+        return ok
+
+    def test_profile_access(self):
+        """Test that profiles are admin-only and unknown profile ids are not found"""
+        url = f"{self.api_url}/admin/profiles"
+        headers = {'Authorization': f'Bearer {self.token}'}
+        print(f"\n🔍 Testing Profile Access...")
+        print(f"   URL: {url}")
+        
+        try:
+            listing = requests.get(url, headers=headers, timeout=10)
+            unknown = requests.get(f"{url}/20000101T000000-00000000", headers=headers, timeout=10)
+            malformed = requests.get(f"{url}/not.a.profile", headers=headers, timeout=10)
+        except Exception as e:
+            self.log_test("Profile Access", False, f"Exception: {str(e)}")
+            return False
+        
+        statuses = [listing.status_code, unknown.status_code, malformed.status_code]
+        if listing.status_code == 403:
+            # Test users are not in PROFILE_ADMIN_IDS unless configured so
+            ok = statuses == [403, 403, 403]
+            self.log_test("Profiles Forbidden For Non-admin", ok, f"Expected [403, 403, 403], got {statuses}")
+        else:
+            ok = statuses == [200, 404, 404]
+            self.log_test("Unknown Profiles Not Found", ok, f"Expected [200, 404, 404], got {statuses}")
+        return ok
+
     def test_create_custom_task(self):
         """Test creating a custom task"""
         if not hasattr(self, 'client_id'):
@@ -358,12 +518,19 @@ class TaskManagerAPITester:
             return False
             
         self.test_get_clients()
+        self.test_idempotent_client_creation()
 
         # Task Management Tests
         print("\n📋 TASK MANAGEMENT TESTS")
         if not self.test_get_tasks_for_client():
             print("❌ Failed to get predefined tasks")
             
+        self.test_query_pending_tasks()
+        self.test_get_tasks_with_fields()
+        self.test_get_tasks_compressed()
+        self.test_batch_requests()
+        self.test_profile_access()
+        
         if not self.test_create_custom_task():
             print("❌ Custom task creation failed")
             
@@ -12,6 +12,11 @@ import { LogOut, Plus, RefreshCw, BarChart3, ListTodo } from 'lucide-react';
 import ClientCard from './ClientCard';
 import StatsPage from './StatsPage';
 
+// Matches BATCH_MAX_REQUESTS on the backend
+const BATCH_SIZE = 25;
+// Only the task fields rendered by ClientCard, TaskItem and EditTaskDialog
+const TASK_FIELDS = 'id,title,description,status,order';
+
 export default function Dashboard({ user, onLogout }) {
   const [clients, setClients] = useState([]);
   const [tasks, setTasks] = useState({});
@@ -32,11 +37,21 @@ export default function Dashboard({ user, onLogout }) {
       const clientsResponse = await axios.get(`${API}/clients`);
       setClients(clientsResponse.data);
 
-      // Fetch tasks for each client
+      // Fetch tasks for all clients through the batch endpoint
       const tasksData = {};
-      for (const client of clientsResponse.data) {
-        const tasksResponse = await axios.get(`${API}/tasks/${client.id}`);
-        tasksData[client.id] = tasksResponse.data;
+      const clientList = clientsResponse.data;
+      for (let i = 0; i < clientList.length; i += BATCH_SIZE) {
+        const chunk = clientList.slice(i, i + BATCH_SIZE);
+        const batchResponse = await axios.post(
+          `${API}/batch`,
+          chunk.map((client) => ({ method: 'GET', path: `/api/tasks/${client.id}?fields=${TASK_FIELDS}` }))
+        );
+        batchResponse.data.forEach((result, idx) => {
+          if (result.status !== 200) {
+            throw new Error(`Failed to fetch tasks for ${chunk[idx].name}: ${result.status}`);
+          }
+          tasksData[chunk[idx].id] = result.body;
+        });
       }
       setTasks(tasksData);
     } catch (error) {